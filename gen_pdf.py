@@ -1,27 +1,78 @@
 import argparse
+import contextlib
+import functools
+import hashlib
 import os
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
 from fpdf import FPDF
 from fpdf.enums import XPos, YPos
-from pygments.lexers import get_lexer_by_name, guess_lexer
+from pygments.lexers import TextLexer, get_lexer_by_name, get_lexer_for_filename
 from pygments.styles import get_style_by_name
-from pygments.token import Token
+from pygments.token import Token, string_to_tokentype
+from pygments.util import ClassNotFound
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import Link
+from pypdf.generic import Fit
+
+LINE_NUMBER_COLOR = (128, 128, 128)
+# (family, style, size) for the per-file header and error/duplicate messages.
+TITLE_FONT = ('Helvetica', 'B', 16)
+PATH_FONT = ('Helvetica', 'I', 10)
+MESSAGE_FONT = ('Helvetica', '', 12)
+# Below this many files, process start-up costs more than parallel lexing saves.
+PARALLEL_MIN_FILES = 4
+# Below this many files, a single renderer beats splitting the work and merging.
+PARALLEL_RENDER_MIN_FILES = 32
+# Larger sources are rendered as plain text; lexing them dominates the run time.
+MAX_HIGHLIGHT_CHARS = 1_000_000
+
+class _Latin1Table(dict):
+    """str.translate table mapping every code point outside latin-1 to '?'."""
+    def __missing__(self, codepoint):
+        self[codepoint] = replacement = codepoint if codepoint < 256 else 0x3F
+        return replacement
+
+_LATIN1_TABLE = _Latin1Table()
+
+# Pre-formatted gutter labels for the first lines of every file.
+_LINE_NUMBER_LABELS = tuple(f"{i:4d} " for i in range(1, 10001))
 
 def find_files(directory, extensions, exclude_suffixes=None):
     """Find all files in a directory with the given extensions, excluding certain suffixes."""
-    if exclude_suffixes is None:
-        exclude_suffixes = []
-        
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if not file.endswith(tuple(extensions)):
-                continue
-            
-            if any(file.endswith(suffix) for suffix in exclude_suffixes):
-                continue
-                
-            yield os.path.join(root, file)
+    ext_tuple = tuple(extensions)
+    excl_tuple = tuple(exclude_suffixes or ())
 
+    # Walk top-down like os.walk, but reuse the DirEntry type/path info that
+    # os.scandir already fetched instead of re-joining and re-statting paths.
+    stack = [directory]
+    while stack:
+        subdirs = []
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    # Like os.walk, don't descend into symlinked directories.
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                        continue
+
+                    name = entry.name
+                    if not name.endswith(ext_tuple):
+                        continue
+
+                    if name.endswith(excl_tuple):
+                        continue
+
+                    yield entry.path
+        except OSError:
+            continue
+        stack.extend(reversed(subdirs))
+
+@functools.lru_cache(maxsize=256)
 def hex_to_rgb(hex_color):
     """Convert a hex color string to an (r, g, b) tuple."""
     if hex_color is None:
@@ -31,89 +82,369 @@ def hex_to_rgb(hex_color):
         hex_color = ''.join(c * 2 for c in hex_color)
     if len(hex_color) != 6:
         return 0, 0, 0
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    return tuple(bytes.fromhex(hex_color))
+
+@functools.lru_cache(maxsize=None)
+def get_lexer_for_extension(extension):
+    """Return the Pygments lexer for a file extension, cached per extension.
+
+    The extension is tried as a lexer alias, then against the lexers' filename
+    patterns (e.g. ``.h``). Anything else is rendered as plain text rather than
+    running guess_lexer(), which tries every registered lexer on the source.
+    """
+    try:
+        return get_lexer_by_name(extension.strip('.'))
+    except ClassNotFound:
+        pass
+    try:
+        return get_lexer_for_filename(f"file{extension}")
+    except ClassNotFound:
+        return TextLexer()
+
+def to_latin1(text):
+    """Replace characters the built-in PDF fonts cannot encode with '?'."""
+    if text.isascii():
+        return text
+    return text.translate(_LATIN1_TABLE)
+
+def content_digest(data):
+    """Return the digest used to recognize byte-identical files."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def file_digest(filepath):
+    """Return a file's content digest, or None if it can't be read."""
+    try:
+        return content_digest(Path(filepath).read_bytes())
+    except OSError:
+        return None
+
+def split_tokens(tokens):
+    """Split (ttype, value) pairs into parallel lists, dropping empty values.
+
+    Returns (ttypes, type_ids, texts, newline_counts): each distinct token type
+    appears once in ttypes, and type_ids indexes into it per token. Token types
+    are given as strings (e.g. 'Token.Name'), since pickling a _TokenType drags
+    its whole parent/subtypes tree along.
+    """
+    type_ids = {}
+    ids, texts, newline_counts = [], [], []
+    for ttype, tvalue in tokens:
+        if not tvalue:
+            continue
+        ids.append(type_ids.setdefault(ttype, len(type_ids)))
+        texts.append(tvalue)
+        newline_counts.append(tvalue.count('\n'))
+    return [str(ttype) for ttype in type_ids], ids, texts, newline_counts
+
+def lex_file(filepath):
+    """Read and tokenize a file.
+
+    Returns (filepath, digest, tokens), where digest identifies the file's
+    content and tokens is the split_tokens() form of the token stream. If the
+    file can't be read or lexed, tokens is the exception (and digest is None
+    when reading failed).
+    """
+    digest = None
+    try:
+        data = Path(filepath).read_bytes()
+        digest = content_digest(data)
+        code = data.decode('utf-8', 'replace')
+        lexer = get_lexer_for_extension(os.path.splitext(filepath)[1])
+        if len(code) > MAX_HIGHLIGHT_CHARS:
+            # TextLexer still normalizes the input but emits it as one token.
+            lexer = TextLexer()
+
+        return filepath, digest, split_tokens(lexer.get_tokens(code, unfiltered=True))
+    except Exception as e:
+        return filepath, digest, e
+
+def coalesce_runs(runs):
+    """Merge adjacent (style, text) runs sharing a style, dropping empty text.
+
+    Whitespace renders the same in any style of a monospaced font, so it joins
+    the neighbouring run instead of forcing a font/color change, and lines
+    holding only whitespace write nothing.
+    """
+    run_style, parts = None, []
+    for style, text in runs:
+        if not text:
+            continue
+        if style != run_style:
+            if text.isspace():
+                parts.append(text)
+                continue
+            if run_style is not None:
+                yield run_style, ''.join(parts)
+                parts = []
+            run_style = style
+        parts.append(text)
+    if run_style is not None:
+        yield run_style, ''.join(parts)
+
+def set_font_once(pdf, font):
+    """Select a (family, style, size) font unless it is already active.
+
+    fpdf's set_font() already skips the PDF operator for an unchanged font;
+    this only saves its argument normalization on repeated calls.
+    """
+    family, style, size = font
+    if pdf.font_family != family.lower() or pdf.font_style != style or pdf.font_size_pt != size:
+        pdf.set_font(family, style, size)
+
+def add_file_header(pdf, filepath):
+    """Write the file name and path heading at the top of a file's first page."""
+    set_font_once(pdf, TITLE_FONT)
+    pdf.cell(0, 10, to_latin1(f"File: {os.path.basename(filepath)}"), new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+    set_font_once(pdf, PATH_FONT)
+    pdf.cell(0, 10, to_latin1(f"Path: {filepath}"), new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+    pdf.ln(10)
 
-def create_pdf(files, output_filename, font_path=None, font_size=10):
-    """Create a PDF from a list of files."""
+def add_duplicate_note(pdf, original_path, original_page, link_page=None):
+    """Point a byte-identical file at the page where its content is rendered.
+
+    The note links to link_page of this pdf, which defaults to original_page.
+    When original_page lives in another document, link to any existing page
+    and retarget the link once the documents are merged.
+    """
+    set_font_once(pdf, MESSAGE_FONT)
+    pdf.cell(0, 10, to_latin1(f"Duplicate of {original_path} (page {original_page})"),
+             link=pdf.add_link(page=link_page or original_page), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+def new_document():
+    """Return an empty FPDF document with the page setup shared by all output."""
     pdf = FPDF()
+    pdf.set_compression(True)
     pdf.set_auto_page_break(True, margin=15)
+    return pdf
+
+def check_font(font_path):
+    """Return font_path if fpdf can load it; otherwise warn and return None."""
+    try:
+        FPDF().add_font('CustomFont', '', font_path)
+    except Exception as e:
+        print(f"Warning: Could not load custom font {font_path}. Falling back to Courier. Error: {e}")
+        return None
+    return font_path
+
+def render_pdf(files, output_filename, font_path=None, font_size=10, jobs=None):
+    """Render files into a single PDF, returning how many pages each file took.
+
+    font_path must already have passed check_font().
+    """
+    pdf = new_document()
     
     style = get_style_by_name('colorful')
     default_text_color = hex_to_rgb(style.style_for_token(Token.Text)['color'])
 
     font_name = 'Courier'
     if font_path:
-        try:
-            pdf.add_font('CustomFont', '', font_path)
-            font_name = 'CustomFont'
-        except Exception as e:
-            print(f"Warning: Could not load custom font {font_path}. Falling back to Courier. Error: {e}")
+        pdf.add_font('CustomFont', '', font_path)
+        font_name = 'CustomFont'
+    core_font = font_name == 'Courier'
+
+    # Token types repeat heavily, so resolve each one's (font_style, color) only
+    # once per run.
+    style_cache = {}
+
+    def token_style(ttype):
+        style_def = style.style_for_token(ttype)
+        font_style = ''
+        # Only apply bold/italic styles for built-in fonts, not custom ones,
+        # as we don't have the bold/italic versions of the custom font.
+        if core_font:
+            if style_def['bold']:
+                font_style += 'B'
+            if style_def['italic']:
+                font_style += 'I'
+        return font_style, hex_to_rgb(style_def['color'])
 
-    for filepath in files:
-        pdf.add_page()
+    # Reading and lexing are independent per file, so farm them out to worker
+    # processes; results come back in submission order to keep pages ordered.
+    parallel = jobs != 1 and len(files) >= PARALLEL_MIN_FILES
+    with ProcessPoolExecutor(jobs) if parallel else contextlib.nullcontext() as executor:
+        lexed = executor.map(lex_file, files, chunksize=4) if parallel else map(lex_file, files)
+        # Content digest -> (path, first page) of the first file with that content.
+        seen = {}
+        first_pages = []
+        for filepath, digest, tokens in lexed:
+            pdf.add_page()
+            first_pages.append(pdf.page_no())
         
-        # Add file metadata
-        pdf.set_font("Helvetica", 'B', 16)
-        pdf.cell(0, 10, f"File: {os.path.basename(filepath)}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        pdf.set_font("Helvetica", 'I', 10)
-        pdf.cell(0, 10, f"Path: {filepath}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        pdf.ln(10)
+            add_file_header(pdf, filepath)
+
+            # Vendored copies and generated files are often byte-identical;
+            # render each distinct content only once.
+            if digest in seen:
+                add_duplicate_note(pdf, *seen[digest])
+                continue
+            if digest is not None:
+                seen[digest] = filepath, pdf.page_no()
 
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                code = f.read()
-            
             try:
-                lexer = get_lexer_by_name(os.path.splitext(filepath)[1].strip('.'))
-            except:
-                lexer = guess_lexer(code)
+                if isinstance(tokens, Exception):
+                    raise tokens
 
-            pdf.set_font(font_name, '', font_size)
-            line_height = pdf.font_size * 1.25
+                pdf.set_font(font_name, '', font_size)
+                cur_font_style = ''
+                line_height = pdf.font_size * 1.25
             
-            line_num = 1
-            pdf.set_text_color(128, 128, 128) # Gray for line numbers
-            pdf.cell(12, line_height, f"{line_num:4d} ", border=0, new_x=XPos.RIGHT, new_y=YPos.TOP)
-            pdf.set_text_color(*default_text_color)
-
-            tokens = lexer.get_tokens(code)
-            for ttype, tvalue in tokens:
-                style_def = style.style_for_token(ttype)
-                color = hex_to_rgb(style_def['color'])
-                
-                font_style = ''
-                # Only apply bold/italic styles for built-in fonts, not custom ones,
-                # as we don't have the bold/italic versions of the custom font.
-                if font_name == 'Courier':
-                    if style_def['bold']:
-                        font_style += 'B'
-                    if style_def['italic']:
-                        font_style += 'I'
-                
-                pdf.set_font(font_name, style=font_style, size=font_size)
-                pdf.set_text_color(*color)
-                
-                lines = tvalue.split('\n')
-                for i, line in enumerate(lines):
-                    if line:
-                        pdf.write(line_height, line)
-                    if i < len(lines) - 1:
+                ttypes, type_ids, texts, newline_counts = tokens
+                # Resolve styles once per distinct token type, indexed by type id.
+                style_table = []
+                for ttype in ttypes:
+                    if ttype not in style_cache:
+                        style_cache[ttype] = token_style(string_to_tokentype(ttype))
+                    style_table.append(style_cache[ttype])
+
+                # Group the token stream into source lines of (style, text) runs.
+                lines = [[]]
+                for type_id, tvalue, newlines in zip(type_ids, texts, newline_counts):
+                    if core_font:
+                        tvalue = to_latin1(tvalue)
+                    run_style = style_table[type_id]
+
+                    # Most tokens sit within a single line; skip the split for those.
+                    if not newlines:
+                        lines[-1].append((run_style, tvalue))
+                        continue
+
+                    fragments = tvalue.split('\n')
+                    lines[-1].append((run_style, fragments[0]))
+                    for fragment in fragments[1:]:
+                        lines.append([(run_style, fragment)])
+
+                cur_color = None
+                for line_num, runs in enumerate(lines, 1):
+                    if line_num > 1:
                         pdf.ln(line_height)
-                        line_num += 1
-                        pdf.set_text_color(128, 128, 128)
-                        pdf.cell(12, line_height, f"{line_num:4d} ", border=0, new_x=XPos.RIGHT, new_y=YPos.TOP)
-                        pdf.set_text_color(*color)
+                    if cur_color != LINE_NUMBER_COLOR:
+                        pdf.set_text_color(*LINE_NUMBER_COLOR)
+                        cur_color = LINE_NUMBER_COLOR
+                    label = _LINE_NUMBER_LABELS[line_num - 1] if line_num <= len(_LINE_NUMBER_LABELS) else f"{line_num:4d} "
+                    pdf.cell(12, line_height, label, border=0, new_x=XPos.RIGHT, new_y=YPos.TOP)
+
+                    for (font_style, color), text in coalesce_runs(runs):
+                        # Only emit font/color operators when the state actually changes.
+                        if font_style != cur_font_style:
+                            pdf.set_font(font_name, style=font_style, size=font_size)
+                            cur_font_style = font_style
+                        if color != cur_color:
+                            pdf.set_text_color(*color)
+                            cur_color = color
+                        pdf.write(line_height, text)
             
-            pdf.set_text_color(*default_text_color)
+                pdf.set_text_color(*default_text_color)
 
-        except Exception as e:
-            pdf.set_font("Helvetica", '', 12)
-            error_message = f"Error processing file {filepath}: {e}"
-            pdf.multi_cell(0, 10, error_message)
+            except Exception as e:
+                set_font_once(pdf, MESSAGE_FONT)
+                error_message = f"Error processing file {filepath}: {e}"
+                pdf.multi_cell(0, 10, to_latin1(error_message))
 
     pdf.output(output_filename)
+    return [end - start for start, end in zip(first_pages, first_pages[1:] + [pdf.page_no() + 1])]
+
+def render_chunk(args):
+    """Render one slice of files to its own PDF; a render_pdf_parallel() worker."""
+    files, output_filename, font_path, font_size = args
+    return render_pdf(files, output_filename, font_path, font_size, jobs=1)
+
+def add_note_page(writer, page, target_index):
+    """Append a duplicate-note page, pointing its link at writer page target_index."""
+    # Copying the annotation as-is would drag the notes PDF's own page along
+    # as its destination, so re-create the link against the merged document.
+    link = page['/Annots'][0].get_object()
+    writer.add_page(page, excluded_keys=('/Annots',))
+    writer.add_annotation(len(writer.pages) - 1, Link(
+        rect=link['/Rect'], border=link['/Border'], target_page_index=target_index,
+        fit=Fit.xyz(left=link['/Dest'][2], top=link['/Dest'][3])))
+
+def render_pdf_parallel(files, output_filename, font_path, font_size, jobs):
+    """Render files across worker processes and merge the parts with pypdf.
+
+    An FPDF document can only be built by one process, so each worker renders a
+    contiguous slice of the files into a temporary PDF. Duplicates are detected
+    across all files up front; their notes are rendered here once the page each
+    original lands on in the merged document is known.
+    """
+    with ProcessPoolExecutor(jobs) as executor, tempfile.TemporaryDirectory() as tmpdir:
+        digests = list(executor.map(file_digest, files, chunksize=16))
+        unique, originals = set(), []
+        for filepath, digest in zip(files, digests):
+            if digest not in unique:
+                originals.append(filepath)
+                if digest is not None:
+                    unique.add(digest)
+
+        chunk_size = -(-len(originals) // jobs)
+        chunks = [originals[i:i + chunk_size] for i in range(0, len(originals), chunk_size)]
+        parts = [os.path.join(tmpdir, f"part{n}.pdf") for n in range(len(chunks))]
+        page_counts = executor.map(render_chunk, [(chunk, part, font_path, font_size) for chunk, part in zip(chunks, parts)])
+
+        # (reader, first page index, page count) of every original, in order.
+        rendered = []
+        for part, counts in zip(parts, page_counts):
+            reader = PdfReader(part)
+            start = 0
+            for count in counts:
+                rendered.append((reader, start, count))
+                start += count
+
+        # Lay out the merged document; each duplicate gets a one-page note.
+        notes = new_document()
+        layout = []
+        # Merged page index of each note -> merged page index it links to.
+        note_targets = {}
+        seen = {}
+        rendered = iter(rendered)
+        page_no = 0
+        for filepath, digest in zip(files, digests):
+            if digest in seen:
+                notes.add_page()
+                add_file_header(notes, filepath)
+                # The original isn't in the notes PDF; link to the note's own
+                # page for now and retarget the link after merging.
+                add_duplicate_note(notes, *seen[digest], link_page=notes.page_no())
+                layout.append((None, notes.page_no() - 1, 1))
+                note_targets[page_no] = seen[digest][1] - 1
+            else:
+                layout.append(next(rendered))
+                if digest is not None:
+                    seen[digest] = filepath, page_no + 1
+            page_no += layout[-1][2]
+
+        notes_reader = PdfReader(BytesIO(notes.output())) if notes.page_no() else None
+        writer = PdfWriter()
+        for reader, start, count in layout:
+            if reader is None:
+                add_note_page(writer, notes_reader.pages[start], note_targets[len(writer.pages)])
+                continue
+            for index in range(start, start + count):
+                writer.add_page(reader.pages[index])
+        # Serialize fully before touching output_filename, like pdf.output().
+        buffer = BytesIO()
+        writer.write(buffer)
+        Path(output_filename).write_bytes(buffer.getbuffer())
+
+def create_pdf(files, output_filename, font_path=None, font_size=10, jobs=None):
+    """Create a PDF from a list of files, using up to jobs worker processes."""
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    # Check the font here so a bad path is reported once, not by every worker.
+    if font_path:
+        font_path = check_font(font_path)
+    if jobs > 1 and len(files) >= PARALLEL_RENDER_MIN_FILES:
+        render_pdf_parallel(files, output_filename, font_path, font_size, jobs)
+    else:
+        render_pdf(files, output_filename, font_path, font_size, jobs)
     print(f"Successfully generated {output_filename}")
 
+def positive_int(value):
+    """argparse type for options that need an integer of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(description="Generate a PDF from source code files with syntax highlighting.")
     parser.add_argument("directory", help="The directory to scan for source code files.")
@@ -122,6 +453,7 @@ def main():
     parser.add_argument("--exclude-suffix", nargs='+', help="A list of file suffixes to exclude (e.g., _test.go .spec.js).")
     parser.add_argument("--font-path", help="Path to a .ttf font file to use for code.")
     parser.add_argument("--font-size", type=int, default=10, help="Font size for the code (default: 10).")
+    parser.add_argument("-j", "--jobs", type=positive_int, help="Number of worker processes (default: number of CPUs).")
     
     args = parser.parse_args()
     
@@ -131,7 +463,7 @@ def main():
         print("No files found with the specified extensions.")
         return
         
-    create_pdf(files_to_process, args.output, args.font_path, args.font_size)
+    create_pdf(files_to_process, args.output, args.font_path, args.font_size, args.jobs)
 
 if __name__ == "__main__":
     main()